@@ -0,0 +1,34 @@
+"""Cached model constructors shared by the test-mic scripts.
+
+Each backend is imported lazily, so a script only needs its own engine
+installed, and a process that asks for the same model twice loads it once.
+"""
+
+import functools
+
+
+@functools.lru_cache(maxsize=4)
+def get_vosk(lang="en-us"):
+    from vosk import Model
+
+    return Model(lang=lang)
+
+
+@functools.lru_cache(maxsize=4)
+def get_whisper(model, device="cpu", compute_type="int8"):
+    from faster_whisper import WhisperModel
+
+    return WhisperModel(model, device=device, compute_type=compute_type)
+
+
+@functools.lru_cache(maxsize=4)
+def get_funasr(model, device="cpu"):
+    from funasr import AutoModel
+
+    return AutoModel(
+        model=model,
+        trust_remote_code=True,
+        vad_model="fsmn-vad",
+        vad_kwargs={"max_single_segment_time": 30000},
+        device=device,
+    )
@@ -0,0 +1,182 @@
+"""Audio buffers shared by the test-mic scripts.
+
+ByteRing hands raw blocks from the PortAudio callback to the consumer loop;
+SampleRing and EnergyGate hold and analyse the float32 window fed to the
+model. The latter two need numpy.
+"""
+
+import collections
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def poll_interval(blocksize, samplerate):
+    """Seconds a consumer should sleep when the ByteRing is empty.
+
+    A quarter of the block period (blocksize / samplerate / 4), capped at
+    5ms, so polling adds at most that much latency to each block.
+    """
+    return min(blocksize / samplerate / 4, 0.005)
+
+
+class ByteRing:
+    """Fixed-size byte ring shared by the PortAudio callback and one reader.
+
+    The writer only ever advances ``tail`` and the reader only ever advances
+    ``head``. Both are plain ints, so under the GIL each update is published
+    atomically, and always after the bytes it covers have been copied. This
+    replaces a locked queue and the per-block bytes copy the callback used
+    to make: write() copies straight into the preallocated buffer. When the
+    reader falls behind and the ring is full, the block is dropped and
+    counted in ``dropped``.
+    """
+
+    def __init__(self, size=1 << 20):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._size = size
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self._reported = 0
+
+    def write(self, data):
+        """Copy a block into the ring. Called from the audio thread."""
+        view = memoryview(data).cast("B")
+        n = view.nbytes
+        if self._size - (self.tail - self.head) < n:
+            self.dropped += 1
+            return False
+        start = self.tail % self._size
+        end = start + n
+        if end <= self._size:
+            self._view[start:end] = view
+        else:
+            split = self._size - start
+            self._view[start:] = view[:split]
+            self._view[: n - split] = view[split:]
+        self.tail += n
+        return True
+
+    def read(self, max_bytes=None):
+        """Return up to max_bytes of pending data and release it to the writer."""
+        n = self.tail - self.head
+        if max_bytes is not None:
+            n = min(n, max_bytes)
+        if n == 0:
+            return b""
+        start = self.head % self._size
+        end = start + n
+        if end <= self._size:
+            data = bytes(self._view[start:end])
+        else:
+            data = bytes(self._view[start:]) + self._view[: end - self._size]
+        self.head += n
+        return data
+
+    def new_drops(self):
+        """Return how many blocks were dropped since the last call. Reader side."""
+        dropped = self.dropped
+        n = dropped - self._reported
+        self._reported = dropped
+        return n
+
+
+class SampleRing:
+    """Fixed-size float32 ring holding the newest samples, scaled to [-1, 1).
+
+    int16 blocks are converted once on the way in, through a preallocated
+    scratch buffer, and copied into place with wrap-around. read() unwraps
+    the window into a second preallocated buffer, so the model works on a
+    stable copy while new audio keeps arriving.
+    """
+
+    def __init__(self, capacity, scratch_size):
+        if np is None:
+            raise ImportError("SampleRing requires numpy")
+        self._ring = np.zeros(capacity, dtype=np.float32)
+        self._window = np.empty(capacity, dtype=np.float32)
+        self._scratch = np.empty(scratch_size, dtype=np.float32)
+        self.write_idx = 0
+        self.filled = 0
+
+    def write_pcm16(self, data):
+        """Append int16 PCM bytes and return them as float32 samples.
+
+        The returned array is a view of the scratch buffer, valid until the
+        next call.
+        """
+        src = np.frombuffer(data, dtype=np.int16)
+        if len(src) > len(self._scratch):
+            chunk = np.multiply(src, np.float32(1.0 / 32768.0), dtype=np.float32)
+        else:
+            chunk = self._scratch[: len(src)]
+            np.multiply(src, np.float32(1.0 / 32768.0), out=chunk, casting="unsafe")
+
+        ring = self._ring
+        n = len(chunk)
+        if n > len(ring):
+            chunk = chunk[-len(ring) :]
+            n = len(ring)
+        end = self.write_idx + n
+        if end <= len(ring):
+            ring[self.write_idx : end] = chunk
+        else:
+            split = len(ring) - self.write_idx
+            ring[self.write_idx :] = chunk[:split]
+            ring[: n - split] = chunk[split:]
+        self.write_idx = end % len(ring)
+        self.filled = min(self.filled + n, len(ring))
+        return chunk
+
+    def read(self):
+        """Return a copy of the newest `filled` samples in time order."""
+        ring, out, filled = self._ring, self._window, self.filled
+        start = (self.write_idx - filled) % len(ring)
+        if start + filled <= len(ring):
+            out[:filled] = ring[start : start + filled]
+        else:
+            split = len(ring) - start
+            out[:split] = ring[start:]
+            out[split:filled] = ring[: filled - split]
+        return out[:filled]
+
+    def clear(self):
+        """Forget the buffered window; new samples start a fresh one."""
+        self.filled = 0
+
+
+class EnergyGate:
+    """Adaptive speech detector on mean |sample| of float32 chunks.
+
+    A chunk counts as voice when its energy exceeds 3x the rolling
+    5th-percentile energy of the last `history` chunks (the noise floor),
+    and at least `min_energy`. active() stays true for `hangover` seconds
+    after the last voiced chunk, keeping trailing silence for endpointing.
+    """
+
+    def __init__(self, hangover=1.5, min_energy=0.002, history=250):
+        if np is None:
+            raise ImportError("EnergyGate requires numpy")
+        self.hangover = hangover
+        self.min_energy = min_energy
+        self._energies = collections.deque(maxlen=history)
+        self.last_voice_time = None
+
+    def update(self, chunk):
+        """Record a chunk's energy and note the time if it is voiced."""
+        energy = float(np.abs(chunk).mean())
+        self._energies.append(energy)
+        threshold = max(float(np.percentile(self._energies, 5)) * 3.0, self.min_energy)
+        if energy > threshold:
+            self.last_voice_time = time.time()
+
+    def active(self):
+        """True if a voiced chunk was seen within the last `hangover` seconds."""
+        if self.last_voice_time is None:
+            return False
+        return time.time() - self.last_voice_time <= self.hangover
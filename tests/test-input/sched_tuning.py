@@ -0,0 +1,82 @@
+"""CPU affinity and priority helpers for the audio callback and ASR threads.
+
+Linux only; on other platforms, or without CAP_SYS_NICE for SCHED_FIFO, the
+helpers leave the thread as it is and report False.
+"""
+
+import os
+import sys
+import threading
+
+AUDIO_CPU = 0
+
+# Native thread id -> whether tuning succeeded, so it is attempted only once.
+_tuned_threads = {}
+
+# Audio-thread failures, kept for the consumer loop to print: the PortAudio
+# callback must not block on stderr.
+_audio_errors = []
+
+
+def _worker_cpus():
+    cpus = os.sched_getaffinity(0) - {AUDIO_CPU}
+    return cpus or {AUDIO_CPU}
+
+
+def pin_audio_thread(priority=10):
+    """Give the calling audio thread SCHED_FIFO priority, then pin it to AUDIO_CPU.
+
+    The thread is only pinned once real-time priority has been granted, so
+    an unprivileged run keeps its original affinity. Cheap to call from
+    every PortAudio callback: the work is done once per thread. Failures
+    are not printed here; collect them with take_audio_errors().
+    """
+    tid = threading.get_native_id()
+    if tid in _tuned_threads:
+        return _tuned_threads[tid]
+    _tuned_threads[tid] = False
+    if not hasattr(os, "sched_setscheduler"):
+        return False
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except OSError as e:
+        _audio_errors.append(f"audio thread stays at normal priority and unpinned: {e}")
+        return False
+    try:
+        os.sched_setaffinity(0, {AUDIO_CPU})
+    except OSError as e:
+        _audio_errors.append(f"audio thread runs SCHED_FIFO but unpinned: {e}")
+        return False
+    _tuned_threads[tid] = True
+    return True
+
+
+def take_audio_errors():
+    """Return and forget the messages pin_audio_thread has recorded so far."""
+    errors = []
+    while _audio_errors:
+        errors.append(_audio_errors.pop(0))
+    return errors
+
+
+def pin_worker_thread(niceness=5):
+    """Keep the calling ASR thread off AUDIO_CPU and lower its priority.
+
+    On failure the thread's original affinity is restored.
+    """
+    tid = threading.get_native_id()
+    if tid in _tuned_threads:
+        return _tuned_threads[tid]
+    _tuned_threads[tid] = False
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    original = os.sched_getaffinity(0)
+    try:
+        os.sched_setaffinity(0, _worker_cpus())
+        os.setpriority(os.PRIO_PROCESS, tid, niceness)
+    except OSError as e:
+        os.sched_setaffinity(0, original)
+        print(f"ASR thread affinity unchanged: {e}", file=sys.stderr)
+        return False
+    _tuned_threads[tid] = True
+    return True
@@ -0,0 +1,28 @@
+"""Background stdout writer so a slow terminal never stalls the recognizer loop."""
+
+import queue
+import sys
+import threading
+
+_log_q = queue.Queue()
+
+
+def _writer():
+    for msg in iter(_log_q.get, None):
+        sys.stdout.write(msg)
+        sys.stdout.flush()
+
+
+_thread = threading.Thread(target=_writer, daemon=True)
+_thread.start()
+
+
+def log(msg):
+    """Queue msg (including any newline) for the writer thread."""
+    _log_q.put(msg)
+
+
+def close_log(timeout=1.0):
+    """Let the writer print everything queued so far, then stop it."""
+    _log_q.put(None)
+    _thread.join(timeout)
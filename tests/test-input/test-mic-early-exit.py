@@ -1,22 +1,38 @@
 #!/usr/bin/env python3
 
 import argparse
-import queue
 import sys
 import time
-import json
-from datetime import datetime
 
 import sounddevice as sd
-from vosk import KaldiRecognizer, Model, SetLogLevel
+from orjson import loads as json_loads
+from vosk import KaldiRecognizer, SetLogLevel
 
-q = queue.Queue()
+from asr_backends import get_vosk
+from audio_ring import ByteRing, poll_interval
+from sched_tuning import pin_audio_thread, pin_worker_thread, take_audio_errors
+from stdout_log import close_log, log
+
+block_ring = ByteRing(1 << 20)
+
+# Drain at most this many pending blocks per recognizer call (10 x 20ms = 200ms).
+MAX_COALESCE = 10
+# Fetch a partial result once at least N blocks have been fed (3 x 20ms = 60ms
+# cadence). Counted in blocks, so coalesced reads do not stretch it.
+PARTIAL_EVERY = 3
+
+# Last formatted second as [epoch second, "HH:MM:SS"]; strftime runs once a second.
+_ts_cache = [None, ""]
 
 
 def log_word(word, latency):
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    print(f"[{timestamp}] WORD: {word} (latency: {latency:.3f}s)")
-    sys.stdout.flush()
+    t = time.time()
+    sec = int(t)
+    if sec != _ts_cache[0]:
+        _ts_cache[0] = sec
+        _ts_cache[1] = time.strftime("%H:%M:%S", time.localtime(sec))
+    timestamp = f"{_ts_cache[1]}.{int((t - sec) * 1000):03d}"
+    log(f"[{timestamp}] WORD: {word} (latency: {latency:.3f}s)\n")
 
 
 def int_or_str(text):
@@ -27,9 +43,10 @@ def int_or_str(text):
 
 
 def callback(indata, frames, time, status):
+    pin_audio_thread()
     if status:
         print(status, file=sys.stderr)
-    q.put(bytes(indata))
+    block_ring.write(indata)
 
 
 parser = argparse.ArgumentParser(add_help=False)
@@ -76,10 +93,7 @@ try:
         device_info = sd.query_devices(device, "input")
         args.samplerate = int(device_info["default_samplerate"])
 
-    if args.model is None:
-        model = Model(lang="en-us")
-    else:
-        model = Model(lang=args.model)
+    model = get_vosk(args.model or "en-us")
 
     if args.filename:
         dump_fn = open(args.filename, "wb")
@@ -94,6 +108,7 @@ try:
         device=args.device,
         dtype="int16",
         channels=1,
+        latency="low",
         callback=callback,
     ):
         print("#" * 80)
@@ -106,62 +121,85 @@ try:
         SetLogLevel(-1)
         last_partial = ""
         phrase_start_time = None
-        recognized_words = []
+        recognized_words = set()
+        last_words = []
         waiting_for_final = False
+        blocks_since_partial = 0
 
+        pin_worker_thread()
         while True:
-            data = q.get()
+            dropped = block_ring.new_drops()
+            if dropped:
+                print(f"input overflow: dropped {dropped} blocks", file=sys.stderr)
+            for err in take_audio_errors():
+                print(err, file=sys.stderr)
+            data = block_ring.read(blocksize * 2 * MAX_COALESCE)
+            if not data:
+                time.sleep(poll_interval(blocksize, args.samplerate))
+                continue
             start_time = time.time()
-
-            partial = rec.PartialResult()
+            blocks_since_partial += len(data) // (blocksize * 2)
+
+            accepted = rec.AcceptWaveform(data)
+            if not accepted and blocks_since_partial >= PARTIAL_EVERY:
+                partial = rec.PartialResult()
+                blocks_since_partial = 0
+            else:
+                partial = None
             if partial:
                 try:
-                    partial_json = json.loads(partial)
+                    partial_json = json_loads(partial)
                     text = partial_json.get("partial", "").strip()
                     if text and text != last_partial:
                         if phrase_start_time is None:
                             phrase_start_time = start_time
 
                         new_words = text.split()
-                        old_words = last_partial.split() if last_partial else []
-                        for i, word in enumerate(new_words):
-                            if i >= len(old_words) or word != old_words[i]:
-                                if word not in recognized_words:
-                                    word_latency = time.time() - phrase_start_time
-                                    print()
-                                    log_word(word, word_latency)
-                                    recognized_words.append(word)
-
-                        sys.stdout.write(f"\r[Partial] {text}" + " " * 40)
-                        sys.stdout.flush()
+                        # Skip the prefix shared with the previous partial;
+                        # anything from the first revised word on is new.
+                        common = min(len(new_words), len(last_words))
+                        start = 0
+                        while start < common and new_words[start] == last_words[start]:
+                            start += 1
+                        for word in new_words[start:]:
+                            if word not in recognized_words:
+                                word_latency = time.time() - phrase_start_time
+                                log("\n")
+                                log_word(word, word_latency)
+                                recognized_words.add(word)
+                        last_words = new_words
+
+                        log(f"\r[Partial] {text}" + " " * 40)
                         last_partial = text
 
                         if len(new_words) >= 2 and not waiting_for_final:
-                            print(f"\n>> Multi-word detected, forcing early exit...")
+                            log("\n>> Multi-word detected, forcing early exit...\n")
                             waiting_for_final = True
 
                 except:
                     pass
 
-            if rec.AcceptWaveform(data) or waiting_for_final:
+            if accepted or waiting_for_final:
                 result = rec.FinalResult()
-                result_json = json.loads(result)
+                result_json = json_loads(result)
                 text = result_json.get("text", "").strip()
                 if text:
                     latency = time.time() - phrase_start_time if phrase_start_time else 0
                     mode = "early" if waiting_for_final else "normal"
-                    sys.stdout.write(f"\r[Final ({mode})] {text} (total latency: {latency:.2f}s)\n")
-                    sys.stdout.flush()
+                    log(f"\r[Final ({mode})] {text} (total latency: {latency:.2f}s)\n")
                     phrase_start_time = None
                     last_partial = ""
-                    recognized_words = []
+                    recognized_words = set()
+                    last_words = []
                     waiting_for_final = False
 
             if dump_fn is not None:
                 dump_fn.write(data)
 
 except KeyboardInterrupt:
+    close_log()
     print("\nDone")
     parser.exit(0)
 except Exception as e:
+    close_log()
     parser.exit(1, type(e).__name__ + ": " + str(e))
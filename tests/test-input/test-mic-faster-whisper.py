@@ -1,23 +1,36 @@
 #!/usr/bin/env python3
 
 import argparse
-import queue
+import asyncio
+import concurrent.futures
 import sys
 import time
 import json
-from datetime import datetime
-import numpy as np
 
 import sounddevice as sd
-from faster_whisper import WhisperModel
 
-q = queue.Queue()
+from asr_backends import get_whisper
+from audio_ring import ByteRing, EnergyGate, SampleRing, poll_interval
+from sched_tuning import pin_audio_thread, pin_worker_thread, take_audio_errors
+from stdout_log import close_log, log
+
+block_ring = ByteRing(1 << 20)
+
+# Drain at most this many pending blocks per pass (10 x 20ms = 200ms).
+MAX_COALESCE = 10
+
+# Last formatted second as [epoch second, "HH:MM:SS"]; strftime runs once a second.
+_ts_cache = [None, ""]
 
 
 def log_word(word, latency):
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    print(f"[{timestamp}] WORD: {word} (latency: {latency:.3f}s)")
-    sys.stdout.flush()
+    t = time.time()
+    sec = int(t)
+    if sec != _ts_cache[0]:
+        _ts_cache[0] = sec
+        _ts_cache[1] = time.strftime("%H:%M:%S", time.localtime(sec))
+    timestamp = f"{_ts_cache[1]}.{int((t - sec) * 1000):03d}"
+    log(f"[{timestamp}] WORD: {word} (latency: {latency:.3f}s)\n")
 
 
 def int_or_str(text):
@@ -27,10 +40,105 @@ def int_or_str(text):
         return text
 
 
+def transcribe(audio_array):
+    """Start a transcription; segments are decoded lazily as they are iterated."""
+    segments, info = model.transcribe(
+        audio_array,
+        language="ru",
+        beam_size=1,
+        best_of=1,
+        vad_filter=True,
+        vad_parameters=dict(min_silence_duration_ms=500, speech_pad_ms=100),
+        condition_on_previous_text=False,
+        without_timestamps=True,
+        word_timestamps=False,
+    )
+    return segments, info
+
+
 def callback(indata, frames, time_info, status):
+    pin_audio_thread()
     if status:
         print(status, file=sys.stderr)
-    q.put(bytes(indata))
+    block_ring.write(indata)
+
+
+async def main():
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=1, initializer=pin_worker_thread)
+    )
+
+    blocksize = int(args.samplerate * 0.02)
+    samples = SampleRing(args.samplerate * 3, blocksize * MAX_COALESCE)
+    gate = EnergyGate()
+
+    async def recognize():
+        phrase_start_time = None
+        last_partial = ""
+        last_result_time = None
+        silence_frames = 0
+
+        while True:
+            await asyncio.sleep(args.interval)
+            if samples.filled < args.samplerate * 0.1:
+                continue
+            if not gate.active():
+                continue
+            audio_array = samples.read()
+
+            segments, info = await asyncio.to_thread(transcribe, audio_array)
+            detected_language = info.language
+
+            segment = await asyncio.to_thread(next, segments, None)
+            current_time = time.time()
+
+            if segment is not None and phrase_start_time is None:
+                phrase_start_time = current_time
+
+            while segment is not None:
+                segment_text = segment.text.strip()
+                if segment_text and segment_text != last_partial:
+                    latency = current_time - phrase_start_time if phrase_start_time else 0
+                    log(f"\r[Partial] {segment_text}" + " " * 40)
+                    last_partial = segment_text
+                    last_result_time = current_time
+                    silence_frames = 0
+                segment = await asyncio.to_thread(next, segments, None)
+                current_time = time.time()
+
+            if last_result_time:
+                elapsed = current_time - last_result_time
+                if elapsed > 1.0:
+                    silence_frames += 1
+
+    with sd.RawInputStream(
+        samplerate=args.samplerate,
+        blocksize=blocksize,
+        device=args.device,
+        dtype="int16",
+        channels=1,
+        latency="low",
+        callback=callback,
+    ):
+        print("Listening... Speak now!")
+        print("-" * 60)
+
+        asr_task = asyncio.create_task(recognize())
+
+        while True:
+            dropped = block_ring.new_drops()
+            if dropped:
+                print(f"input overflow: dropped {dropped} blocks", file=sys.stderr)
+            for err in take_audio_errors():
+                print(err, file=sys.stderr)
+            data = block_ring.read(blocksize * 2 * MAX_COALESCE)
+            if not data:
+                await asyncio.sleep(poll_interval(blocksize, args.samplerate))
+                continue
+            gate.update(samples.write_pcm16(data))
+
+            if asr_task.done():
+                asr_task.result()
 
 
 parser = argparse.ArgumentParser(add_help=False)
@@ -57,99 +165,61 @@ parser.add_argument(
     "-m",
     "--model",
     type=str,
-    default="bzikst/faster-whisper-large-v3-russian",
-    help="model name or path (default: bzikst/faster-whisper-large-v3-russian)",
+    help="model name or path, e.g. bzikst/faster-whisper-large-v3-russian "
+    "(overrides --model-size)",
+)
+parser.add_argument(
+    "--model-size",
+    choices=["tiny", "base", "small", "medium", "large-v3"],
+    default="small",
+    help="stock Whisper model size; small is the largest that keeps up "
+    "in real time on CPU (default: small)",
+)
+parser.add_argument(
+    "--device-id",
+    choices=["cpu", "cuda", "auto"],
+    default="cpu",
+    help="device for faster-whisper; the GPU index is not part of it (default: cpu)",
 )
 parser.add_argument(
     "--compute-type",
     type=str,
-    default="int8",
-    help="compute type: int8, float16, float32 (default: int8)",
+    help="compute type: int8, int8_float16, float16, float32 "
+    "(default: int8_float16 on cuda, int8 on cpu and auto)",
+)
+parser.add_argument(
+    "--interval",
+    type=float,
+    default=1.0,
+    help="seconds between transcriptions of the audio window (default: 1.0)",
 )
 args = parser.parse_args(remaining)
 
 try:
     if args.samplerate is None:
         args.samplerate = 16000
+    if args.model is None:
+        args.model = args.model_size
+    if args.compute_type is None:
+        args.compute_type = "int8_float16" if args.device_id == "cuda" else "int8"
 
     print("#" * 80)
-    print("faster-whisper real-time recognition (CPU mode)")
+    print(f"faster-whisper real-time recognition ({args.device_id.upper()} mode)")
     print(f"Model: {args.model}")
     print(f"Compute type: {args.compute_type}")
     print("Press Ctrl+C to stop")
     print("#" * 80)
 
     print("Loading model...")
-    model = WhisperModel(
-        args.model,
-        device="cpu",
-        compute_type=args.compute_type,
-    )
+    model = get_whisper(args.model, args.device_id, args.compute_type)
     print("Model loaded!")
 
-    blocksize = int(args.samplerate * 0.02)
-
-    with sd.RawInputStream(
-        samplerate=args.samplerate,
-        blocksize=blocksize,
-        device=args.device,
-        dtype="int16",
-        channels=1,
-        callback=callback,
-    ):
-        print("Listening... Speak now!")
-        print("-" * 60)
-
-        audio_buffer = b""
-        phrase_start_time = None
-        last_partial = ""
-        last_result_time = None
-        silence_frames = 0
-        silence_threshold = int(1.5 * args.samplerate / blocksize)
-
-        while True:
-            data = q.get()
-            audio_buffer += data
-
-            audio_array = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-
-            segments, info = model.transcribe(
-                audio_array,
-                language="ru",
-                beam_size=5,
-                vad_filter=True,
-                vad_parameters=dict(min_silence_duration_ms=500),
-            )
-
-            current_time = time.time()
-
-            detected_language = info.language
-            segments_list = list(segments)
-            has_speech = len(segments_list) > 0
-
-            if has_speech and phrase_start_time is None:
-                phrase_start_time = current_time
-
-            for segment in segments_list:
-                segment_text = segment.text.strip()
-                if segment_text and segment_text != last_partial:
-                    latency = current_time - phrase_start_time if phrase_start_time else 0
-                    sys.stdout.write(f"\r[Partial] {segment_text}" + " " * 40)
-                    sys.stdout.flush()
-                    last_partial = segment_text
-                    last_result_time = current_time
-                    silence_frames = 0
-
-            if last_result_time:
-                elapsed = current_time - last_result_time
-                if elapsed > 1.0:
-                    silence_frames += 1
-
-            if len(audio_buffer) > args.samplerate * 3:
-                audio_buffer = audio_buffer[-args.samplerate:]
+    asyncio.run(main())
 
 except KeyboardInterrupt:
+    close_log()
     print("\nDone")
     parser.exit(0)
 except Exception as e:
+    close_log()
     parser.exit(1, type(e).__name__ + ": " + str(e))
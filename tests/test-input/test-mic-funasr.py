@@ -1,23 +1,36 @@
 #!/usr/bin/env python3
 
 import argparse
-import queue
+import asyncio
+import concurrent.futures
 import sys
 import time
 import json
-from datetime import datetime
-import numpy as np
 
 import sounddevice as sd
-from funasr import AutoModel
 
-q = queue.Queue()
+from asr_backends import get_funasr
+from audio_ring import ByteRing, EnergyGate, SampleRing, poll_interval
+from sched_tuning import pin_audio_thread, pin_worker_thread, take_audio_errors
+from stdout_log import close_log, log
+
+block_ring = ByteRing(1 << 20)
+
+# Drain at most this many pending blocks per pass (10 x 20ms = 200ms).
+MAX_COALESCE = 10
+
+# Last formatted second as [epoch second, "HH:MM:SS"]; strftime runs once a second.
+_ts_cache = [None, ""]
 
 
 def log_word(word, latency):
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    print(f"[{timestamp}] WORD: {word} (latency: {latency:.3f}s)")
-    sys.stdout.flush()
+    t = time.time()
+    sec = int(t)
+    if sec != _ts_cache[0]:
+        _ts_cache[0] = sec
+        _ts_cache[1] = time.strftime("%H:%M:%S", time.localtime(sec))
+    timestamp = f"{_ts_cache[1]}.{int((t - sec) * 1000):03d}"
+    log(f"[{timestamp}] WORD: {word} (latency: {latency:.3f}s)\n")
 
 
 def int_or_str(text):
@@ -28,9 +41,90 @@ def int_or_str(text):
 
 
 def callback(indata, frames, time_info, status):
+    pin_audio_thread()
     if status:
         print(status, file=sys.stderr)
-    q.put(bytes(indata))
+    block_ring.write(indata)
+
+
+async def main():
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=1, initializer=pin_worker_thread)
+    )
+
+    blocksize = int(args.samplerate * 0.02)
+    samples = SampleRing(args.samplerate * 5, blocksize * MAX_COALESCE)
+    gate = EnergyGate()
+
+    async def recognize():
+        phrase_start_time = None
+        last_result = ""
+
+        while True:
+            await asyncio.sleep(args.interval)
+            if samples.filled < args.samplerate * 0.1:
+                continue
+            if not gate.active():
+                if last_result:
+                    # Phrase is over: commit it and slice its audio off the
+                    # window so the next phrase is not re-encoded with it.
+                    samples.clear()
+                    phrase_start_time = None
+                    last_result = ""
+                continue
+            audio_array = samples.read()
+
+            current_time = time.time()
+
+            res = await asyncio.to_thread(
+                model.generate,
+                input=[audio_array],
+                cache={},
+                language="ru",
+                use_itn=True,
+            )
+
+            if res and len(res) > 0:
+                text = res[0].get("text", "").strip()
+
+                if text:
+                    if phrase_start_time is None:
+                        phrase_start_time = current_time
+
+                    if text != last_result:
+                        latency = current_time - phrase_start_time if phrase_start_time else 0
+                        log("\n")
+                        log_word(text, latency)
+                        last_result = text
+
+    with sd.RawInputStream(
+        samplerate=args.samplerate,
+        blocksize=blocksize,
+        device=args.device,
+        dtype="int16",
+        channels=1,
+        latency="low",
+        callback=callback,
+    ):
+        print("Listening... Speak now!")
+        print("-" * 60)
+
+        asr_task = asyncio.create_task(recognize())
+
+        while True:
+            dropped = block_ring.new_drops()
+            if dropped:
+                print(f"input overflow: dropped {dropped} blocks", file=sys.stderr)
+            for err in take_audio_errors():
+                print(err, file=sys.stderr)
+            data = block_ring.read(blocksize * 2 * MAX_COALESCE)
+            if not data:
+                await asyncio.sleep(poll_interval(blocksize, args.samplerate))
+                continue
+            gate.update(samples.write_pcm16(data))
+
+            if asr_task.done():
+                asr_task.result()
 
 
 parser = argparse.ArgumentParser(add_help=False)
@@ -66,6 +160,12 @@ parser.add_argument(
     default="cpu",
     help="device: cpu, cuda:0 (default: cpu)",
 )
+parser.add_argument(
+    "--interval",
+    type=float,
+    default=1.0,
+    help="seconds between recognitions of the audio window (default: 1.0)",
+)
 args = parser.parse_args(remaining)
 
 try:
@@ -80,66 +180,15 @@ try:
     print("#" * 80)
 
     print("Loading model...")
-    model = AutoModel(
-        model=args.model,
-        trust_remote_code=True,
-        vad_model="fsmn-vad",
-        vad_kwargs={"max_single_segment_time": 30000},
-        device=args.device_id,
-    )
+    model = get_funasr(args.model, args.device_id)
     print("Model loaded!")
 
-    blocksize = int(args.samplerate * 0.02)
-
-    with sd.RawInputStream(
-        samplerate=args.samplerate,
-        blocksize=blocksize,
-        device=args.device,
-        dtype="int16",
-        channels=1,
-        callback=callback,
-    ):
-        print("Listening... Speak now!")
-        print("-" * 60)
-
-        phrase_start_time = None
-        last_result = ""
-        audio_buffer = b""
-
-        while True:
-            data = q.get()
-            audio_buffer += data
-
-            if len(audio_buffer) < args.samplerate * 0.1:
-                continue
-
-            current_time = time.time()
-
-            res = model.generate(
-                input=[audio_buffer],
-                cache={},
-                language="ru",
-                use_itn=True,
-            )
-
-            if res and len(res) > 0:
-                text = res[0].get("text", "").strip()
-
-                if text:
-                    if phrase_start_time is None:
-                        phrase_start_time = current_time
-
-                    if text != last_result:
-                        latency = current_time - phrase_start_time if phrase_start_time else 0
-                        print()
-                        log_word(text, latency)
-                        last_result = text
-
-            if len(audio_buffer) > args.samplerate * 5:
-                audio_buffer = audio_buffer[-args.samplerate:]
+    asyncio.run(main())
 
 except KeyboardInterrupt:
+    close_log()
     print("\nDone")
     parser.exit(0)
 except Exception as e:
+    close_log()
     parser.exit(1, type(e).__name__ + ": " + str(e))
@@ -5,14 +5,19 @@
 # For more help run: `python test_microphone.py -h`
 
 import argparse
-import queue
 import sys
 import time
 
 import sounddevice as sd
-from vosk import KaldiRecognizer, Model, SetLogLevel
+from vosk import KaldiRecognizer, SetLogLevel
 
-q = queue.Queue()
+from asr_backends import get_vosk
+from audio_ring import ByteRing, poll_interval
+
+block_ring = ByteRing(1 << 20)
+
+# Drain at most this many pending blocks per recognizer call (4 x 50ms = 200ms).
+MAX_COALESCE = 4
 
 
 def int_or_str(text):
@@ -27,7 +32,7 @@ def callback(indata, frames, time, status):
     """This is called (from a separate thread) for each audio block."""
     if status:
         print(status, file=sys.stderr)
-    q.put(bytes(indata))
+    block_ring.write(indata)
 
 
 parser = argparse.ArgumentParser(add_help=False)
@@ -74,19 +79,18 @@ try:
         device_info = sd.query_devices(device, "input")
         args.samplerate = int(device_info["default_samplerate"])  # type: ignore
 
-    if args.model is None:
-        model = Model(lang="en-us")
-    else:
-        model = Model(lang=args.model)
+    model = get_vosk(args.model or "en-us")
 
     if args.filename:
         dump_fn = open(args.filename, "wb")
     else:
         dump_fn = None
 
+    blocksize = int(args.samplerate * 0.05)
+
     with sd.RawInputStream(
         samplerate=args.samplerate,
-        blocksize=int(args.samplerate * 0.05),
+        blocksize=blocksize,
         device=args.device,
         dtype="int16",
         channels=1,
@@ -102,7 +106,13 @@ try:
 
         SetLogLevel(1)
         while True:
-            data = q.get()
+            dropped = block_ring.new_drops()
+            if dropped:
+                print(f"input overflow: dropped {dropped} blocks", file=sys.stderr)
+            data = block_ring.read(blocksize * 2 * MAX_COALESCE)
+            if not data:
+                time.sleep(poll_interval(blocksize, args.samplerate))
+                continue
             start_time = time.time()
             if rec.AcceptWaveform(data):
                 result = rec.Result()
@@ -1,20 +1,32 @@
 #!/usr/bin/env python3
 
 import argparse
-import queue
 import sys
 import time
 import json
-from datetime import datetime
 
 import sounddevice as sd
-from vosk import KaldiRecognizer, Model, SetLogLevel, SpkModel
+from vosk import KaldiRecognizer, SetLogLevel, SpkModel
 
-q = queue.Queue()
+from asr_backends import get_vosk
+from audio_ring import ByteRing, poll_interval
+
+block_ring = ByteRing(1 << 20)
+
+# Drain at most this many pending blocks per recognizer call (10 x 20ms = 200ms).
+MAX_COALESCE = 10
+
+# Last formatted second as [epoch second, "HH:MM:SS"]; strftime runs once a second.
+_ts_cache = [None, ""]
 
 
 def log_word(word, latency):
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+    t = time.time()
+    sec = int(t)
+    if sec != _ts_cache[0]:
+        _ts_cache[0] = sec
+        _ts_cache[1] = time.strftime("%H:%M:%S", time.localtime(sec))
+    timestamp = f"{_ts_cache[1]}.{int((t - sec) * 1000):03d}"
     print(f"[{timestamp}] WORD: {word} (latency: {latency:.3f}s)")
     sys.stdout.flush()
 
@@ -29,7 +41,7 @@ def int_or_str(text):
 def callback(indata, frames, time, status):
     if status:
         print(status, file=sys.stderr)
-    q.put(bytes(indata))
+    block_ring.write(indata)
 
 
 parser = argparse.ArgumentParser(add_help=False)
@@ -76,10 +88,7 @@ try:
         device_info = sd.query_devices(device, "input")
         args.samplerate = int(device_info["default_samplerate"])
 
-    if args.model is None:
-        model = Model(lang="en-us")
-    else:
-        model = Model(lang=args.model)
+    model = get_vosk(args.model or "en-us")
 
     if args.filename:
         dump_fn = open(args.filename, "wb")
@@ -109,7 +118,13 @@ try:
         recognized_words = []
 
         while True:
-            data = q.get()
+            dropped = block_ring.new_drops()
+            if dropped:
+                print(f"input overflow: dropped {dropped} blocks", file=sys.stderr)
+            data = block_ring.read(blocksize * 2 * MAX_COALESCE)
+            if not data:
+                time.sleep(poll_interval(blocksize, args.samplerate))
+                continue
             start_time = time.time()
 
             partial = rec.PartialResult()
@@ -5,14 +5,23 @@
 # For more help run: `python test_microphone.py -h`
 
 import argparse
-import queue
+import json
 import sys
 import time
 
 import sounddevice as sd
-from vosk import KaldiRecognizer, Model, SetLogLevel
+from vosk import KaldiRecognizer, SetLogLevel
+
+from asr_backends import get_vosk
+from audio_ring import ByteRing, poll_interval
+from sched_tuning import pin_audio_thread, pin_worker_thread, take_audio_errors
+from stdout_log import close_log, log
+
+block_ring = ByteRing(1 << 20)
+
+# Drain at most this many pending blocks per recognizer call (2 x 100ms = 200ms).
+MAX_COALESCE = 2
 
-q = queue.Queue()
 speech_start_time = None
 
 
@@ -26,9 +35,10 @@ def int_or_str(text):
 
 def callback(indata, frames, time, status):
     """This is called (from a separate thread) for each audio block."""
+    pin_audio_thread()
     if status:
         print(status, file=sys.stderr)
-    q.put(bytes(indata))
+    block_ring.write(indata)
 
 
 parser = argparse.ArgumentParser(add_help=False)
@@ -76,22 +86,22 @@ try:
         # soundfile expects an int, sounddevice provides a float:
         args.samplerate = int(16000)  # type: ignore
 
-    if args.model is None:
-        model = Model(lang="en-us")
-    else:
-        model = Model(lang=args.model)
+    model = get_vosk(args.model or "en-us")
 
     if args.filename:
         dump_fn = open(args.filename, "wb")
     else:
         dump_fn = None
 
+    blocksize = int(args.samplerate * 0.10)
+
     with sd.RawInputStream(
         samplerate=args.samplerate,
-        blocksize=int(args.samplerate * 0.10),
+        blocksize=blocksize,
         device=args.device,
         dtype="int16",
         channels=1,
+        latency="low",
         callback=callback,
     ):
         print("#" * 80)
@@ -100,33 +110,43 @@ try:
         print("samplerate= ", args.samplerate)
         print("blocksize=", args.samplerate * 0.10)
 
+        SetLogLevel(-1)
         rec = KaldiRecognizer(model, args.samplerate)
         # rec.SetWords(True)
         # rec.SetEndpointerMode(EndpointerMode.SHORT)
 
-        SetLogLevel(1)
+        pin_worker_thread()
         while True:
-            data = q.get()
-            partial = rec.PartialResult()
-            if partial and speech_start_time is None:
+            dropped = block_ring.new_drops()
+            if dropped:
+                print(f"input overflow: dropped {dropped} blocks", file=sys.stderr)
+            for err in take_audio_errors():
+                print(err, file=sys.stderr)
+            data = block_ring.read(blocksize * 2 * MAX_COALESCE)
+            if not data:
+                time.sleep(poll_interval(blocksize, args.samplerate))
+                continue
+            if speech_start_time is None:
+                partial = rec.PartialResult()
                 try:
-                    partial_json = eval(partial) if partial.startswith("{") else {}
-                    if partial_json.get("partial"):
+                    if json.loads(partial).get("partial"):
                         speech_start_time = time.time()
-                except:
+                except json.JSONDecodeError:
                     pass
             if rec.AcceptWaveform(data):
-                result = rec.Result()
-                print(result)
+                result = rec.Result() + "\n"
                 if speech_start_time is not None:
                     latency = time.time() - speech_start_time
-                    print(f"[Latency: {latency:.3f}s]")
+                    result += f"[Latency: {latency:.3f}s]\n"
                     speech_start_time = None
+                log(result)
             if dump_fn is not None:
                 dump_fn.write(data)
 
 except KeyboardInterrupt:
+    close_log()
     print("\nDone")
     parser.exit(0)
 except Exception as e:
+    close_log()
     parser.exit(1, type(e).__name__ + ": " + str(e))